@@ -1,18 +1,47 @@
 import click
 import boto3
-from botocore.exceptions import ClientError, EndpointConnectionError
+import threading
+from botocore.exceptions import ClientError, EndpointConnectionError, ProfileNotFound
+from libs.rate_limiter import scheduler
 
+# Session, account alias and account ID per AWS profile, created once and shared by all clients
+_sessions = {}
+_session_locks = {}
+_lock = threading.Lock()
+
+
+def _get_session(profile):
+    """Returns the cached session, account alias and account ID for a profile (None for the current credentials)"""
+    with _lock:
+        profile_lock = _session_locks.setdefault(profile, threading.Lock())
+    with profile_lock:
+        if profile not in _sessions:
+            session = boto3.Session(profile_name=profile)
+            # IAM and STS are global, their calls are rate limited like every other client
+            # The account ID is needed to key the STS bucket, so only the single identity lookup runs before it is registered
+            sts = session.client('sts')
+            account_id = str(sts.get_caller_identity().get('Account'))
+            scheduler.register(sts, account_id, 'global')
+            iam = session.client('iam')
+            scheduler.register(iam, account_id, 'global')
+            # Accounts without an alias are named by their account ID
+            aliases = iam.list_account_aliases()['AccountAliases']
+            account = aliases[0] if aliases else account_id
+            _sessions[profile] = (session, profile_lock, account, account_id)
+        return _sessions[profile]
 
 
 # ---------------- GET AWS CLIENT ----------------------------
-def get_aws_client(service_name, region, *args):
-    """Returns the AWS client for the specified service and region"""
+def get_aws_client(service_name, region, *args, profile=None):
+    """Returns the AWS client for the specified service and region (optionally using a named AWS profile)"""
     try:
-        session = boto3.Session(region_name=region)
-        client = session.client(service_name, *args)
-        account = boto3.client('iam').list_account_aliases()['AccountAliases'][0]
-        account_id = str(boto3.client('sts').get_caller_identity().get('Account'))
+        session, profile_lock, account, account_id = _get_session(profile)
+        # Sessions are not thread-safe, so clients are created one at a time
+        with profile_lock:
+            client = session.client(service_name, region, *args)
+        # Rate limit the client together with every other client for the same account and region
+        scheduler.register(client, account_id, region)
         return client, account, account_id
-    except (ClientError, EndpointConnectionError) as e:
+    except (ClientError, EndpointConnectionError, ProfileNotFound) as e:
         click.echo(f"Failed to create AWS client for {service_name} in {region}: {e}")
         return None
@@ -0,0 +1,66 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# GetMetricData accepts up to 500 queries per call
+MAX_QUERIES = 500
+HOUR = 3600
+DAY = 86400
+# CloudWatch keeps daily (1 hour and longer) datapoints for 455 days
+RETENTION_DAYS = 455
+
+
+# ---------------- CLOUDWATCH METRIC QUERIES ----------------------------
+def metric_query(query_id, namespace, metric_name, dimensions, stat, period=DAY):
+    """Returns a GetMetricData query for a single metric, dimensions is a dict of dimension name to value"""
+    return {
+        'Id': query_id,
+        'MetricStat': {
+            'Metric': {
+                'Namespace': namespace,
+                'MetricName': metric_name,
+                'Dimensions': [{'Name': name, 'Value': value} for name, value in dimensions.items()],
+            },
+            'Period': period,
+            'Stat': stat,
+        },
+        'ReturnData': True,
+    }
+
+
+def get_metric_data(cloudwatch, queries, start_time, end_time):
+    """Fetches the values of the queries in batches of 500 queries per call, keyed by query ID"""
+    values = {query['Id']: [] for query in queries}
+    paginator = cloudwatch.get_paginator('get_metric_data')
+    for i in range(0, len(queries), MAX_QUERIES):
+        for page in paginator.paginate(MetricDataQueries=queries[i:i + MAX_QUERIES], StartTime=start_time, EndTime=end_time):
+            for result in page['MetricDataResults']:
+                values[result['Id']].extend(result['Values'])
+    return values
+
+
+def fetch_metrics(requests, start_time, end_time):
+    """Fetches metric data for several regions concurrently, requests maps region to (cloudwatch client, queries)"""
+    if not requests:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        futures = {region: executor.submit(get_metric_data, cloudwatch, queries, start_time, end_time) for region, (cloudwatch, queries) in requests.items() if queries}
+        return {region: futures[region].result() if region in futures else {} for region in requests}
+
+
+# ---------------- IDLE STATISTICS ----------------------------
+def summarize(values, query_ids):
+    """Returns the number of datapoints, maximum and mean of each query as arrays ordered like query_ids (NaN without datapoints)"""
+    series = [values.get(query_id, []) for query_id in query_ids]
+    counts = np.array([len(s) for s in series], dtype=int)
+    width = counts.max() if len(series) else 0
+
+    # Pad the series into a matrix with one row per query
+    mask = np.arange(width) < counts[:, None]
+    matrix = np.zeros((len(series), width))
+    if width:
+        matrix[mask] = np.concatenate([np.asarray(s, dtype=float) for s in series])
+
+    has_data = counts > 0
+    maxes = np.where(has_data, np.max(np.where(mask, matrix, -np.inf), axis=1, initial=-np.inf), np.nan)
+    means = np.where(has_data, matrix.sum(axis=1) / np.maximum(counts, 1), np.nan)
+    return counts, maxes, means
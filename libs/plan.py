@@ -0,0 +1,100 @@
+import click
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+
+# ---------------- STATE FINGERPRINTS ----------------------------
+# Only the fields that decide whether a resource is eligible for cleanup are fingerprinted,
+# so that apply can detect resources that changed between the dry-run and the delete.
+def _instance_state(instance):
+    return [instance['State']['Name'], instance.get('StateTransitionReason')]
+
+def _volume_state(volume):
+    return [volume['State'], sorted(a['InstanceId'] for a in volume.get('Attachments', []))]
+
+def _image_state(image):
+    return [image['State'], sorted(ebs['Ebs']['SnapshotId'] for ebs in image.get('BlockDeviceMappings', []) if 'Ebs' in ebs and 'SnapshotId' in ebs['Ebs'])]
+
+def _snapshot_state(snapshot):
+    return [snapshot['State'], snapshot.get('VolumeId'), snapshot.get('Description')]
+
+def _rds_snapshot_state(snapshot):
+    return [snapshot['Status'], snapshot['SnapshotCreateTime']]
+
+def _rds_instance_state(instance):
+    return [instance['DBInstanceStatus'], instance['InstanceCreateTime']]
+
+def _vpn_state(vpn):
+    # LastStatusChange keeps changing even for inactive tunnels, so only the tunnel status is compared
+    return [vpn['State'], sorted((t['OutsideIpAddress'], t['Status']) for t in vpn.get('VgwTelemetry', []))]
+
+STATE_FIELDS = {
+    'ec2-instance': _instance_state,
+    'ebs-volume': _volume_state,
+    'ami': _image_state,
+    'ec2-snapshot': _snapshot_state,
+    'rds-snapshot': _rds_snapshot_state,
+    'rds-instance': _rds_instance_state,
+    'vpn-connection': _vpn_state,
+}
+
+
+def fingerprint(resource_type, resource):
+    """Returns a short hash of the state of a resource that is relevant for cleanup"""
+    state = json.dumps(STATE_FIELDS[resource_type](resource), default=str, sort_keys=True)
+    return hashlib.sha256(state.encode()).hexdigest()[:16]
+
+
+# ---------------- WRITE / READ PLAN FILE ----------------------------
+def plan_metric(namespace, metric_name, dimensions, stat, threshold):
+    """Describes the CloudWatch metric a resource was found idle by, it counts as active again once a value reaches the threshold"""
+    return {'namespace': namespace, 'name': metric_name, 'dimensions': dimensions, 'stat': stat, 'threshold': threshold}
+
+
+def plan_entry(resource_type, row, headers, resource, metric=None):
+    """Builds a plan entry from an output row and the described resource it was built from"""
+    entry = {
+        'type': resource_type,
+        'account': row[0],
+        'account_id': row[1],
+        'region': row[2],
+        'id': row[3],
+        'fingerprint': fingerprint(resource_type, resource),
+        'headers': headers,
+        'row': list(row),
+        'created': datetime.now(timezone.utc).isoformat(),
+    }
+    # Resources found idle by a metric are re-checked for activity since the plan was created
+    if metric:
+        entry['metric'] = metric
+    return entry
+
+
+def write_plan(entries, filename):
+    """Appends plan entries to a JSON lines plan file"""
+    try:
+        with open(filename, 'a') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, default=str) + '\n')
+    except IOError:
+        click.echo(f"\nError: Could not write plan to {filename}")
+
+
+def read_plan(filename):
+    """Reads plan entries from a JSON lines plan file"""
+    if not os.path.isfile(filename):
+        click.echo(f"Plan file {filename} does not exist")
+        return []
+    entries = []
+    with open(filename, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError as e:
+                click.echo(f"Skipping invalid plan entry on line {line_number}: {e}")
+    return entries
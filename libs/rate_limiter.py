@@ -0,0 +1,141 @@
+import click
+import threading
+import time
+from collections import OrderedDict
+from itertools import zip_longest
+
+# Error codes AWS services use to signal throttling
+THROTTLE_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottled', 'RequestThrottledException',
+    'RequestLimitExceeded', 'TooManyRequestsException', 'SlowDown', 'PriorRequestNotComplete',
+    'BandwidthLimitExceeded', 'ProvisionedThroughputExceededException',
+}
+
+# Starting (and maximum) requests per second for each (account, region, service, API family)
+DEFAULT_RATES = {'describe': 20.0, 'mutate': 5.0}
+MIN_RATE = 0.5
+# Refill rate is halved on every throttle and grows back by this share of the maximum on every success
+ADDITIVE_INCREASE = 0.02
+
+
+def api_family(operation_name):
+    """Returns the API family an operation is throttled under"""
+    if operation_name.startswith(('Describe', 'List', 'Get')):
+        return 'describe'
+    return 'mutate'
+
+
+# ---------------- TOKEN BUCKET ----------------------------
+class TokenBucket:
+    """Token bucket that serves waiting callers in arrival order and adapts its refill rate to throttling"""
+
+    def __init__(self, rate):
+        self.max_rate = rate
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+        self.next_ticket = 0
+        self.serving = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.max_rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Blocks until a token is available and returns the time spent waiting"""
+        start = time.monotonic()
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            while True:
+                timeout = None
+                if ticket == self.serving:
+                    self._refill()
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.serving += 1
+                        self.condition.notify_all()
+                        return time.monotonic() - start
+                    timeout = (1 - self.tokens) / self.rate
+                self.condition.wait(timeout)
+
+    def throttled(self):
+        with self.condition:
+            self.rate = max(MIN_RATE, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self):
+        with self.condition:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * ADDITIVE_INCREASE)
+
+
+# ---------------- SCHEDULER ----------------------------
+class Scheduler:
+    """Rate limits every AWS call per (account, region, service, API family) across all clients and threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.stats = {}
+
+    def register(self, client, account_id, region):
+        """Routes every request (including retries) made by a boto3 client through the scheduler"""
+        service = client.meta.service_model.service_name
+
+        def before_send(event_name, **kwargs):
+            self._acquire((account_id, region, service, api_family(event_name.rsplit('.', 1)[-1])))
+
+        def needs_retry(event_name, response=None, **kwargs):
+            if response is None:
+                return
+            key = (account_id, region, service, api_family(event_name.rsplit('.', 1)[-1]))
+            error_code = response[1].get('Error', {}).get('Code')
+            self._observe(key, error_code in THROTTLE_CODES)
+
+        client.meta.events.register('before-send', before_send)
+        client.meta.events.register('needs-retry', needs_retry)
+
+    def _bucket(self, key):
+        with self.lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(DEFAULT_RATES[key[3]])
+                self.stats[key] = {'calls': 0, 'throttles': 0, 'wait': 0.0}
+            return self.buckets[key]
+
+    def _acquire(self, key):
+        wait = self._bucket(key).acquire()
+        with self.lock:
+            self.stats[key]['calls'] += 1
+            self.stats[key]['wait'] += wait
+
+    def _observe(self, key, throttled):
+        bucket = self._bucket(key)
+        if throttled:
+            bucket.throttled()
+            with self.lock:
+                self.stats[key]['throttles'] += 1
+        else:
+            bucket.succeeded()
+
+    def report(self):
+        """Writes the number of calls, throttles and time spent queued per API family to the console"""
+        with self.lock:
+            stats = sorted(self.stats.items())
+        if not stats:
+            return
+        click.echo("\nAPI rate limits (account - region - service - API family: calls, throttles, time queued):")
+        for (account_id, region, service, family), stat in stats:
+            click.echo(f"{account_id} - {region} - {service} - {family}: {stat['calls']} calls, {stat['throttles']} throttled, {stat['wait']:.1f}s queued")
+
+
+scheduler = Scheduler()
+
+
+def fair_order(tasks, key):
+    """Orders tasks round-robin by key, so that work for one large key does not queue ahead of all the others"""
+    groups = OrderedDict()
+    for task in tasks:
+        groups.setdefault(key(task), []).append(task)
+    return [task for batch in zip_longest(*groups.values()) for task in batch if task is not None]
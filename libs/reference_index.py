@@ -0,0 +1,77 @@
+import click
+import mmap
+import struct
+
+# ---------------- ORG-WIDE REFERENCE INDEX FILE ----------------------------
+# Layout: magic, number of AMI IDs, number of snapshot IDs, followed by both ID lists
+# sorted and padded to a fixed width. Loading maps the file into memory without parsing it,
+# and membership checks are a binary search over the fixed-width records.
+MAGIC = b'ARCIDX1\n'
+HEADER = struct.Struct('<QQ')
+ID_WIDTH = 24
+
+
+def write_index(filename, ami_ids, snapshot_ids):
+    """Writes the referenced AMI and snapshot IDs to a reference index file, returns False if it cannot be written"""
+    amis = sorted(set(ami_ids))
+    snapshots = sorted(set(snapshot_ids))
+    try:
+        with open(filename, 'wb') as f:
+            f.write(MAGIC)
+            f.write(HEADER.pack(len(amis), len(snapshots)))
+            for resource_id in amis + snapshots:
+                f.write(resource_id.encode().ljust(ID_WIDTH, b'\0'))
+    except IOError:
+        click.echo(f"\nError: Could not write reference index to {filename}")
+        return False
+    return True
+
+
+class _SortedIds:
+    """Membership test over a block of sorted fixed-width IDs in a memory-mapped file"""
+
+    def __init__(self, data, offset, count):
+        self.data = data
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, resource_id):
+        key = resource_id.encode().ljust(ID_WIDTH, b'\0')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            start = self.offset + middle * ID_WIDTH
+            record = self.data[start:start + ID_WIDTH]
+            if record < key:
+                low = middle + 1
+            elif record > key:
+                high = middle
+            else:
+                return True
+        return False
+
+
+class ReferenceIndex:
+    """AMI and snapshot IDs referenced anywhere in the organization, loaded from a reference index file"""
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{filename} is not a reference index file")
+        ami_count, snapshot_count = HEADER.unpack_from(self.data, len(MAGIC))
+        offset = len(MAGIC) + HEADER.size
+        self.amis = _SortedIds(self.data, offset, ami_count)
+        self.snapshots = _SortedIds(self.data, offset + ami_count * ID_WIDTH, snapshot_count)
+
+
+def load_index(filename):
+    """Loads a reference index file, returns None if it cannot be read"""
+    try:
+        return ReferenceIndex(filename)
+    except (IOError, ValueError) as e:
+        click.echo(f"Error loading reference index {filename}: {e}")
+        return None
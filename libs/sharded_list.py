@@ -0,0 +1,111 @@
+import click
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+# Current long EC2 IDs are "0" followed by 16 random hex digits (snap-0…, ami-0…), legacy IDs are 8 random hex digits.
+# Shards are built from ID prefixes: "0" plus two hex digits splits long IDs into 256 even parts, and the first digit
+# "1" to "f" splits legacy IDs into 15 of 16 even parts (legacy IDs starting with "0" fall under the long ID prefixes).
+HEX = '0123456789abcdef'
+LONG_ID_PREFIXES = ['0' + a + b for a in HEX for b in HEX]
+LEGACY_ID_PREFIXES = list(HEX[1:])
+LEGACY_ID_LENGTH = 8
+MAX_SHARDS = len(LONG_ID_PREFIXES)
+PAGE_SIZE = 1000
+# Number of resources the auto heuristic aims for per shard (a few pages each)
+TARGET_SHARD_SIZE = 5 * PAGE_SIZE
+MAX_WORKERS = 32
+
+
+def validate_shards(ctx, param, value):
+    """Click callback for --shards, accepts 'auto' or a number of shards between 1 and 256"""
+    if value == 'auto':
+        return value
+    try:
+        shards = int(value)
+    except ValueError:
+        raise click.BadParameter("must be 'auto' or a number")
+    if not 1 <= shards <= MAX_SHARDS:
+        raise click.BadParameter(f"must be between 1 and {MAX_SHARDS}")
+    return shards
+
+
+def shard_prefixes(shards):
+    """Deals the ID prefixes round-robin into the given number of shards, so every shard gets an even share of long and legacy IDs"""
+    prefixes = LONG_ID_PREFIXES + LEGACY_ID_PREFIXES
+    return [prefixes[i::shards] for i in range(shards)]
+
+
+# ---------------- SHARDED LISTING ----------------------------
+def list_resources(client, operation, result_key, id_key, id_filter, id_prefix, shards='auto', **kwargs):
+    """Lists resources by paging through ID prefix shards concurrently, falls back to a single listing for small inventories"""
+    if not client.can_paginate(operation):
+        return getattr(client, operation)(**kwargs)[result_key]
+
+    if shards == 'auto':
+        # Small inventories fit in the first page
+        first_page = getattr(client, operation)(MaxResults=PAGE_SIZE, **kwargs)
+        if not first_page.get('NextToken'):
+            return first_page[result_key]
+        shards = _estimate_shards(client, operation, result_key, id_key, id_filter, id_prefix, first_page, **kwargs)
+        if shards == 1:
+            # Continue the single listing after the first page instead of starting over
+            return first_page[result_key] + _list_shard(client, operation, result_key, None, first_page['NextToken'], **kwargs)
+    if shards == 1:
+        return _list_shard(client, operation, result_key, None, None, **kwargs)
+
+    shard_filters = [{'Name': id_filter, 'Values': [f"{id_prefix}{prefix}*" for prefix in prefixes]} for prefixes in shard_prefixes(shards)]
+    with ThreadPoolExecutor(max_workers=min(shards, MAX_WORKERS)) as executor:
+        results = executor.map(lambda shard_filter: _list_shard(client, operation, result_key, shard_filter, None, **kwargs), shard_filters)
+        # Shards do not overlap, but resources created while listing can show up twice, so deduplicate by ID
+        resources = {}
+        for shard in results:
+            for resource in shard:
+                resources[resource[id_key]] = resource
+    return list(resources.values())
+
+
+def _list_shard(client, operation, result_key, shard_filter, starting_token, **kwargs):
+    if shard_filter:
+        kwargs['Filters'] = kwargs.get('Filters', []) + [shard_filter]
+    pagination = {'PageSize': PAGE_SIZE}
+    if starting_token:
+        pagination['StartingToken'] = starting_token
+    paginator = client.get_paginator(operation)
+    resources = []
+    for page in paginator.paginate(PaginationConfig=pagination, **kwargs):
+        resources.extend(page[result_key])
+    return resources
+
+
+def _probe(client, operation, result_key, id_filter, pattern, **kwargs):
+    """Returns the number of resources matching an ID pattern, or None if they do not fit in one page"""
+    kwargs['Filters'] = kwargs.get('Filters', []) + [{'Name': id_filter, 'Values': [pattern]}]
+    page = getattr(client, operation)(MaxResults=PAGE_SIZE, **kwargs)
+    return None if page.get('NextToken') else len(page[result_key])
+
+
+def _estimate_shards(client, operation, result_key, id_key, id_filter, id_prefix, first_page, **kwargs):
+    """Estimates the number of shards by probing a 1/256 long ID prefix and a 1/16 legacy ID prefix, when the first page has such IDs"""
+    ids = [resource[id_key][len(id_prefix):] for resource in first_page[result_key]]
+    estimate = 0
+    if any(len(resource_id) > LEGACY_ID_LENGTH for resource_id in ids):
+        count = _probe(client, operation, result_key, id_filter, f"{id_prefix}{LONG_ID_PREFIXES[0]}*", **kwargs)
+        if count is None:
+            return MAX_SHARDS
+        estimate += count * len(LONG_ID_PREFIXES)
+    if any(len(resource_id) == LEGACY_ID_LENGTH for resource_id in ids):
+        count = _probe(client, operation, result_key, id_filter, f"{id_prefix}{LEGACY_ID_PREFIXES[0]}*", **kwargs)
+        if count is None:
+            return MAX_SHARDS
+        estimate += count * len(HEX)
+    return min(MAX_SHARDS, max(1, math.ceil(estimate / TARGET_SHARD_SIZE)))
+
+
+def list_snapshots(ec2, shards='auto'):
+    """Lists the EC2 snapshots owned by the account"""
+    return list_resources(ec2, 'describe_snapshots', 'Snapshots', 'SnapshotId', 'snapshot-id', 'snap-', shards, OwnerIds=['self'])
+
+
+def list_images(ec2, shards='auto'):
+    """Lists the AMIs owned by the account"""
+    return list_resources(ec2, 'describe_images', 'Images', 'ImageId', 'image-id', 'ami-', shards, Owners=['self'])
@@ -1,9 +1,12 @@
 from libs.write_output import write_output
 from libs.get_client import get_aws_client
+from libs.plan import plan_entry, write_plan
+from libs.reference_index import load_index
+from libs.sharded_list import list_images, validate_shards
 import click
 import boto3
+import botocore
 from datetime import datetime, timedelta
-import re
 
 @click.group()
 def cli():
@@ -17,7 +20,10 @@ def cli():
 @click.option('-d', '--delete', is_flag=True, default=False, help='Delete all unused AMIs (and associated snapshots) that are older than the specified age')
 @click.option('--snapshots', default='yes', type=click.Choice(['yes', 'no']), required=False, is_eager=True, help='Display/delete associated snapshots along with the AMI. Set to "no" to disable. Only available with --dry-run or --delete.')
 @click.option('-f', '--file', help='Custom file name to write output to')
-def ami(region, age, dry_run, delete, file, snapshots):
+@click.option('--plan', help='Write a plan of the dry-run to this file so it can be executed later with apply')
+@click.option('--reference-index', help='Reference index file built with the reference-index command. AMIs used in any account or region of the index are kept')
+@click.option('--shards', default='auto', callback=validate_shards, help='Number of shards to list AMIs with in parallel (1-256), or "auto" to choose from the size of the inventory')
+def ami(region, age, dry_run, delete, file, snapshots, plan, reference_index, shards):
     """Deregister unused AMIs and delete associated snapshots older than a specified age"""
 
     if not any([dry_run, delete]):
@@ -50,53 +56,44 @@ def ami(region, age, dry_run, delete, file, snapshots):
                 click.echo(f"Error occurred while listing instance image: {e}")
                 return None
 
-    # Get AMIs for all ASGs in use
-    asg_amis = []
+    # Get AMIs for all ASGs in use (launch configurations and the launch template versions ASGs reference)
     try:
-        paginator = asg.get_paginator('describe_auto_scaling_groups')
-        # Search for instances in the "InService" state and get their InstanceId, LaunchTemplateId, and LaunchTemplateVersion
-        filtered_asgs = paginator.paginate().search("AutoScalingGroups[*].[Instances[?LifecycleState == 'InService'].[InstanceId, LaunchTemplate.LaunchTemplateId,LaunchTemplate.Version]]")
+        asg_amis = list(get_asg_amis(ec2, asg))
     except Exception as e:
         click.echo(f"An error occurred while getting Auto Scaling groups in region {region}: {str(e)}")
-
-        # Iterate through the Auto Scaling groups and get the AMI ID of each instance
-        for key_data in filtered_asgs:
-            try:
-                matches = re.findall(r"'(.+?)'",str(key_data))
-                if len(matches) < 3:
-                    # Handle the error here (e.g. click.echo a message, skip this iteration of the loop, etc.)
-                    continue
-                instance_id, template, version = matches[:3]
-                launch_template_versions = ec2.describe_launch_template_versions(LaunchTemplateId=template, Versions=[version]);  
-                used_ami_id = launch_template_versions["LaunchTemplateVersions"][0]["LaunchTemplateData"]["ImageId"]
-                if not used_ami_id:
-                    click.echo(f"Failed to find AMI for launch template {template} version {version}")
-                    continue
-                asg_amis.append(used_ami_id)
-            except Exception as e:
-                click.echo(f"An error occurred while processing an Auto Scaling group: {str(e)}")
-                continue
+        return
 
     # Get complete list of AMIs in use
     amis_in_use = []
     amis_in_use = list(set(asg_amis + instance_amis))
     # click.echo(amis_in_use)
 
+    # Load AMIs used in other accounts and regions of the organization
+    index = None
+    if reference_index:
+        index = load_index(reference_index)
+        if index is None:
+            return
+
     # List existing AMIs
     try:
-        amis = ec2.describe_images(Owners=['self'])['Images']
+        amis = list_images(ec2, shards)
     except Exception as e:
         click.echo(f"Error occurred while listing AMIs: {e}")
         return
     
     # Filter unused AMIs  by age
     amis_to_deregister = []
+    plan_entries = []
     for ami in amis:
         try:
             # Check if 'CreationDate' is present in the ami dictionary and not empty
             if ami.get('CreationDate'):
                 start_time = datetime.strptime(ami['CreationDate'], '%Y-%m-%dT%H:%M:%S.%fZ')
                 cutoff_time = datetime.utcnow() - timedelta(days=age)
+                # Skip AMIs used in other accounts and regions
+                if index is not None and ami['ImageId'] in index.amis:
+                    continue
                 if ami['ImageId'] not in amis_in_use and age > 0 and start_time < cutoff_time:
                     start_date = start_time.strftime('%Y-%m-%d')
                     # Get the value of AMI Name, if it exists
@@ -117,6 +114,7 @@ def ami(region, age, dry_run, delete, file, snapshots):
                     else:
                         amis_to_deregister.append((account, account_id, region, ami['ImageId'], ami_name, start_date))
                         headers=["Account", "Account ID", "Region", "AMI ID", "AMI name", "Creation Date"]
+                    plan_entries.append(plan_entry('ami', amis_to_deregister[-1], headers, ami))
         except Exception as e:
             click.echo(f"Error filtering unused AMIs {ami['ImageId']}: {e}")
      
@@ -128,34 +126,79 @@ def ami(region, age, dry_run, delete, file, snapshots):
             # click.echo(ami)
             output.append(ami[:len(ami)])
         write_output(output, headers, filename=file)
+        if plan:
+            write_plan(plan_entries, plan)
 
     # Deregister unused AMIs and associated snapshots
     elif delete and amis_to_deregister:
-        resources_deleted = 0
-        snapshots_deleted = 0
-        for ami in amis_to_deregister:
-            try:
-                ec2.deregister_image(ImageId=ami[3])
-                if delete_snap_bool and ami[6]:
-                    try:
-                        for snapshot in ami[6]:
-                            ec2.delete_snapshot(SnapshotId=snapshot[0])
-                    except Exception as e:
-                        click.echo(f"{account} - {region}: Error deleting snapshot {snapshot[0]}: {e}")
-                    else:
-                        # click.echo(f"Deleted snapshot {snapshot[0]}")
-                        snapshots_deleted += 1
-            except Exception as e:
-                click.echo(f"{account} - {region}: Error deregistering AMI {ami[3]}: {e}")
-            else:
-                # click.echo(f"Deregistered AMI {ami[3]}")
-                output.append(ami)
-                resources_deleted += 1
-        if delete_snap_bool:
-            click.echo(f"\n{account} - {region}: Deleted {resources_deleted} AMIs and {snapshots_deleted} snapshots")
-        else:
-            click.echo(f"\n{account} - {region}: Deleted {resources_deleted} AMIs")
+        output = delete_amis(ec2, account, region, amis_to_deregister, delete_snap_bool)
         write_output(output, headers, filename=file)
     # No unused AMIs found
     else:
         click.echo(f"{account} - {region}: No unused AMIs found exceeding the specified age")
+
+
+# ---------------- DEREGISTER AMIS AND SNAPSHOTS ----------------------------
+def delete_amis(ec2, account, region, amis_to_deregister, delete_snap_bool):
+    """Deregisters the given AMIs (and deletes associated snapshots) and returns the rows that were deregistered"""
+    output = []
+    resources_deleted = 0
+    snapshots_deleted = 0
+    for ami in amis_to_deregister:
+        try:
+            ec2.deregister_image(ImageId=ami[3])
+            if delete_snap_bool and ami[6]:
+                try:
+                    for snapshot in ami[6]:
+                        ec2.delete_snapshot(SnapshotId=snapshot[0])
+                except Exception as e:
+                    click.echo(f"{account} - {region}: Error deleting snapshot {snapshot[0]}: {e}")
+                else:
+                    # click.echo(f"Deleted snapshot {snapshot[0]}")
+                    snapshots_deleted += 1
+        except Exception as e:
+            click.echo(f"{account} - {region}: Error deregistering AMI {ami[3]}: {e}")
+        else:
+            # click.echo(f"Deregistered AMI {ami[3]}")
+            output.append(ami)
+            resources_deleted += 1
+    if delete_snap_bool:
+        click.echo(f"\n{account} - {region}: Deleted {resources_deleted} AMIs and {snapshots_deleted} snapshots")
+    else:
+        click.echo(f"\n{account} - {region}: Deleted {resources_deleted} AMIs")
+    return output
+
+
+# ---------------- GET AMIS USED BY AUTO SCALING GROUPS ----------------------------
+def get_asg_amis(ec2, asg):
+    """Returns the AMI IDs used by launch configurations and by the launch template versions that ASGs and their instances reference"""
+    ami_ids = set()
+    paginator = asg.get_paginator('describe_launch_configurations')
+    ami_ids.update(paginator.paginate().search("LaunchConfigurations[].ImageId"))
+
+    # Collect (template ID, template name, version) referenced by the ASG, its mixed instances policy and its instances
+    templates = {}
+    paginator = asg.get_paginator('describe_auto_scaling_groups')
+    for group in paginator.paginate().search("AutoScalingGroups[]"):
+        mixed_instances = group.get('MixedInstancesPolicy', {}).get('LaunchTemplate', {})
+        specs = [group.get('LaunchTemplate'), mixed_instances.get('LaunchTemplateSpecification')]
+        specs += [override.get('LaunchTemplateSpecification') for override in mixed_instances.get('Overrides', [])]
+        specs += [instance.get('LaunchTemplate') for instance in group.get('Instances', [])]
+        for spec in specs:
+            if spec:
+                templates[(spec.get('LaunchTemplateId'), spec.get('LaunchTemplateName'), spec.get('Version') or '$Default')] = True
+
+    for template_id, template_name, version in templates:
+        template = {'LaunchTemplateId': template_id} if template_id else {'LaunchTemplateName': template_name}
+        try:
+            versions = ec2.describe_launch_template_versions(Versions=[version], **template)['LaunchTemplateVersions']
+        except botocore.exceptions.ClientError as e:
+            # Instances launched from a deleted template (version) are already covered by their own ImageId
+            if e.response['Error']['Code'].startswith('InvalidLaunchTemplate') and 'NotFound' in e.response['Error']['Code']:
+                click.echo(f"Skipping launch template {template_id or template_name} version {version}: {e}")
+                continue
+            raise
+        ami_ids.update(template_version['LaunchTemplateData'].get('ImageId') for template_version in versions)
+
+    # Launch templates can point to SSM parameters instead of AMI IDs
+    return {ami_id for ami_id in ami_ids if ami_id and ami_id.startswith('ami-')}
@@ -0,0 +1,226 @@
+from libs.write_output import write_output
+from libs.get_client import get_aws_client
+from libs.plan import fingerprint, read_plan
+from libs.metrics import metric_query, get_metric_data, summarize, HOUR
+from .ec2_instances import delete_ec2_instances
+from .ebs_volumes import delete_ebs_volumes
+from .ami import delete_amis, get_asg_amis
+from .ec2_snapshots import delete_ec2_snapshots
+from .rds_snapshots import delete_rds_snapshots
+from .vpn_connections import delete_vpn_connections
+from .idle_rds_instances import delete_rds_instances
+import click
+from datetime import datetime, timezone
+
+# Number of IDs sent in a single describe filter
+BATCH_SIZE = 200
+
+@click.group()
+def cli():
+    pass
+
+# ---------------- APPLY A DRY-RUN PLAN ----------------------------
+@cli.command()
+@click.argument('plan')
+@click.option('-f', '--file', help='Custom file name to write output to')
+def apply(plan, file):
+    """Delete the resources recorded in a dry-run plan without rescanning the account"""
+
+    entries = read_plan(plan)
+    if not entries:
+        click.echo(f"No resources found in plan {plan}")
+        return
+
+    # Group plan entries by region, resource type and output headers (duplicate entries are collapsed by ID)
+    groups = {}
+    for entry in entries:
+        key = (entry['region'], entry['type'], tuple(entry['headers']))
+        groups.setdefault(key, {})[entry['id']] = entry
+
+    matched_entries = 0
+    current_account_id = None
+    for (region, resource_type, headers), planned in groups.items():
+        if resource_type not in RESOURCE_TYPES:
+            click.echo(f"Skipping unknown resource type {resource_type} in plan")
+            continue
+        service, get_current, delete_resources = RESOURCE_TYPES[resource_type]
+
+        # Set up AWS client
+        client, account, account_id = get_aws_client(service, region)
+
+        current_account_id = account_id
+
+        # Plans can span several accounts, only apply the entries of the current account
+        other_accounts = sorted({entry['account_id'] for entry in planned.values() if entry['account_id'] != account_id})
+        if other_accounts:
+            skipped = sum(1 for entry in planned.values() if entry['account_id'] != account_id)
+            click.echo(f"{account} - {region}: Skipping {skipped} planned {resource_type} resources of other accounts: {', '.join(other_accounts)}")
+        planned = {resource_id: entry for resource_id, entry in planned.items() if entry['account_id'] == account_id}
+        matched_entries += len(planned)
+        if not planned:
+            continue
+
+        # Re-check the planned resources with batched describe-by-ID calls
+        try:
+            current = get_current(client, list(planned))
+        except Exception as e:
+            click.echo(f"{account} - {region}: Error re-checking planned {resource_type} resources: {e}")
+            continue
+
+        unchanged = []
+        for resource_id, entry in planned.items():
+            if resource_id not in current:
+                click.echo(f"{account} - {region}: Skipping {resource_id} since it no longer exists or is in use")
+            elif fingerprint(resource_type, current[resource_id]) != entry['fingerprint']:
+                click.echo(f"{account} - {region}: Skipping {resource_id} since it changed after the plan was created")
+            else:
+                unchanged.append(entry)
+
+        # Resources found idle by a metric are re-checked for activity since the plan was created
+        metric_entries = [entry for entry in unchanged if 'metric' in entry]
+        if metric_entries:
+            cloudwatch, account, account_id = get_aws_client('cloudwatch', region)
+            try:
+                active = recent_activity(cloudwatch, metric_entries)
+            except Exception as e:
+                click.echo(f"{account} - {region}: Error re-checking metrics of planned {resource_type} resources: {e}")
+                continue
+            for resource_id in sorted(active):
+                click.echo(f"{account} - {region}: Skipping {resource_id} since it was active after the plan was created")
+            unchanged = [entry for entry in unchanged if entry['id'] not in active]
+        resources_to_delete = [tuple(entry['row']) for entry in unchanged]
+
+        if not resources_to_delete:
+            click.echo(f"{account} - {region}: No planned {resource_type} resources left to delete")
+            continue
+        output = delete_resources(client, account, region, resources_to_delete, list(headers))
+        write_output(output, list(headers), filename=file)
+
+    if matched_entries == 0:
+        click.echo(f"\nNo entries in plan {plan} belong to the current account {current_account_id}, nothing was deleted")
+
+
+# ---------------- RE-CHECK PLANNED RESOURCES ----------------------------
+def _batches(ids):
+    for i in range(0, len(ids), BATCH_SIZE):
+        yield ids[i:i + BATCH_SIZE]
+
+
+def current_instances(ec2, ids):
+    """Returns the planned EC2 instances that still exist, keyed by instance ID"""
+    current = {}
+    paginator = ec2.get_paginator('describe_instances')
+    for batch in _batches(ids):
+        for page in paginator.paginate(Filters=[{'Name': 'instance-id', 'Values': batch}]):
+            for reservation in page['Reservations']:
+                for instance in reservation['Instances']:
+                    current[instance['InstanceId']] = instance
+    return current
+
+
+def current_volumes(ec2, ids):
+    """Returns the planned EBS volumes that still exist, keyed by volume ID"""
+    current = {}
+    paginator = ec2.get_paginator('describe_volumes')
+    for batch in _batches(ids):
+        for page in paginator.paginate(Filters=[{'Name': 'volume-id', 'Values': batch}]):
+            for volume in page['Volumes']:
+                current[volume['VolumeId']] = volume
+    return current
+
+
+def current_images(ec2, ids, asg=None):
+    """Returns the planned AMIs that still exist and are not used by an instance or an ASG, keyed by AMI ID"""
+    current = {}
+    if asg is None:
+        asg, account, account_id = get_aws_client('autoscaling', ec2.meta.region_name)
+    paginator = ec2.get_paginator('describe_instances')
+    for batch in _batches(ids):
+        for image in ec2.describe_images(Filters=[{'Name': 'image-id', 'Values': batch}])['Images']:
+            current[image['ImageId']] = image
+        # Drop AMIs that got launched after the plan was created
+        in_use = paginator.paginate(Filters=[{'Name': 'image-id', 'Values': batch}]).search("Reservations[].Instances[?State.Name != 'terminated'].ImageId[]")
+        for image_id in in_use:
+            current.pop(image_id, None)
+    # Drop AMIs that got added to a launch configuration or an ASG's launch template after the plan was created
+    for image_id in get_asg_amis(ec2, asg):
+        current.pop(image_id, None)
+    return current
+
+
+def current_snapshots(ec2, ids):
+    """Returns the planned EC2 snapshots that still exist and are not linked to an AMI, keyed by snapshot ID"""
+    current = {}
+    paginator = ec2.get_paginator('describe_snapshots')
+    for batch in _batches(ids):
+        for page in paginator.paginate(OwnerIds=['self'], Filters=[{'Name': 'snapshot-id', 'Values': batch}]):
+            for snapshot in page['Snapshots']:
+                current[snapshot['SnapshotId']] = snapshot
+        # Drop snapshots that got linked to an AMI after the plan was created
+        images = ec2.describe_images(Owners=['self'], Filters=[{'Name': 'block-device-mapping.snapshot-id', 'Values': batch}])['Images']
+        for image in images:
+            for ebs in image['BlockDeviceMappings']:
+                if 'Ebs' in ebs and 'SnapshotId' in ebs['Ebs']:
+                    current.pop(ebs['Ebs']['SnapshotId'], None)
+    return current
+
+
+def current_rds_snapshots(rds, ids):
+    """Returns the planned RDS instance and cluster snapshots that still exist, keyed by snapshot name"""
+    current = {}
+    instance_paginator = rds.get_paginator('describe_db_snapshots')
+    cluster_paginator = rds.get_paginator('describe_db_cluster_snapshots')
+    for batch in _batches(ids):
+        for page in instance_paginator.paginate(Filters=[{'Name': 'db-snapshot-id', 'Values': batch}]):
+            for snapshot in page['DBSnapshots']:
+                current[snapshot['DBSnapshotIdentifier']] = snapshot
+        for page in cluster_paginator.paginate(Filters=[{'Name': 'db-cluster-snapshot-id', 'Values': batch}]):
+            for snapshot in page['DBClusterSnapshots']:
+                current[snapshot['DBClusterSnapshotIdentifier']] = snapshot
+    return current
+
+
+def current_rds_instances(rds, ids):
+    """Returns the planned RDS instances that still exist, keyed by instance name"""
+    current = {}
+    paginator = rds.get_paginator('describe_db_instances')
+    for batch in _batches(ids):
+        for page in paginator.paginate(Filters=[{'Name': 'db-instance-id', 'Values': batch}]):
+            for instance in page['DBInstances']:
+                current[instance['DBInstanceIdentifier']] = instance
+    return current
+
+
+def current_vpn_connections(ec2, ids):
+    """Returns the planned VPN connections that still exist, keyed by VPN connection ID"""
+    current = {}
+    for batch in _batches(ids):
+        for vpn in ec2.describe_vpn_connections(Filters=[{'Name': 'vpn-connection-id', 'Values': batch}])['VpnConnections']:
+            if vpn['State'] != 'deleted':
+                current[vpn['VpnConnectionId']] = vpn
+    return current
+
+
+def recent_activity(cloudwatch, entries):
+    """Returns the IDs of the planned resources whose metric reached its threshold since the plan was created"""
+    query_ids = [f"m{i}" for i in range(len(entries))]
+    queries = [metric_query(query_id, entry['metric']['namespace'], entry['metric']['name'], entry['metric']['dimensions'], entry['metric']['stat'], period=HOUR)
+               for query_id, entry in zip(query_ids, entries)]
+    # One batched GetMetricData window from the oldest plan entry until now
+    start_time = min(datetime.fromisoformat(entry['created']) for entry in entries)
+    values = get_metric_data(cloudwatch, queries, start_time, datetime.now(timezone.utc))
+    _, maxes, _ = summarize(values, query_ids)
+    # Resources without datapoints since the plan stay idle (NaN never reaches the threshold)
+    return {entry['id'] for entry, maximum in zip(entries, maxes) if maximum >= entry['metric']['threshold']}
+
+
+# Resource type -> (AWS service, re-check function, delete function taking (client, account, region, rows, headers))
+RESOURCE_TYPES = {
+    'ec2-instance': ('ec2', current_instances, lambda ec2, account, region, rows, headers: delete_ec2_instances(ec2, account, region, rows)),
+    'ebs-volume': ('ec2', current_volumes, lambda ec2, account, region, rows, headers: delete_ebs_volumes(ec2, account, region, rows, 'Snapshot ID' in headers)),
+    'ami': ('ec2', current_images, lambda ec2, account, region, rows, headers: delete_amis(ec2, account, region, rows, 'Snapshots' in headers)),
+    'ec2-snapshot': ('ec2', current_snapshots, lambda ec2, account, region, rows, headers: delete_ec2_snapshots(ec2, account, region, rows)),
+    'rds-snapshot': ('rds', current_rds_snapshots, lambda rds, account, region, rows, headers: delete_rds_snapshots(rds, account, region, rows)),
+    'rds-instance': ('rds', current_rds_instances, lambda rds, account, region, rows, headers: delete_rds_instances(rds, account, region, rows)),
+    'vpn-connection': ('ec2', current_vpn_connections, lambda ec2, account, region, rows, headers: delete_vpn_connections(ec2, account, region, rows)),
+}
@@ -1,5 +1,6 @@
 from libs.write_output import write_output
 from libs.get_client import get_aws_client
+from libs.plan import plan_entry, write_plan
 import click
 import boto3
 import botocore
@@ -17,7 +18,8 @@ def cli():
 @click.option('-d', '--delete', is_flag=True, default=False, help='Delete all unattached volumes (and associated snapshots) that are older than the specified age')
 @click.option('--snapshots', default='yes', type=click.Choice(['yes', 'no']), required=False, is_eager=True, help='Display/delete associated snapshots along with the AMI. Set to "no" to disable. Only available with --dry-run or --delete.')
 @click.option('-f', '--file', help='Custom file name to write output to')
-def ebs_volumes(region, age, dry_run, delete, file, snapshots):
+@click.option('--plan', help='Write a plan of the dry-run to this file so it can be executed later with apply')
+def ebs_volumes(region, age, dry_run, delete, file, snapshots, plan):
     """Delete unattached and unused EBS volumes and associated snapshots older than a specified age"""
 
     if not any([dry_run, delete]):
@@ -42,6 +44,7 @@ def ebs_volumes(region, age, dry_run, delete, file, snapshots):
         click.echo(f"Failed to list volumes with status code {volume_response['ResponseMetadata']['HTTPStatusCode']}")
         return
     volumes_to_delete = []
+    plan_entries = []
     cutoff_time = datetime.now(timezone.utc) - timedelta(days=age)
     for volume in volume_response['Volumes']:
         try:
@@ -59,6 +62,7 @@ def ebs_volumes(region, age, dry_run, delete, file, snapshots):
                     else:
                         volumes_to_delete.append((account, account_id, region, volume['VolumeId'], name_tag, volume['Size'], volume['VolumeType'], volume.get('Iops'), start_date))
                         headers=["Account", "Account ID", "Region", "EBS Volume ID", "Volume name", "Volume size (GiB)", "Volume type", "Iops", "Creation Date"]
+                    plan_entries.append(plan_entry('ebs-volume', volumes_to_delete[-1], headers, volume))
         except Exception as e:
             click.echo(f"Error filtering volume {volume['VolumeId']}: {e}")
       
@@ -70,39 +74,49 @@ def ebs_volumes(region, age, dry_run, delete, file, snapshots):
         for volume in volumes_to_delete:
             output.append(volume[:len(volume)])
         write_output(output, headers, filename=file)
+        if plan:
+            write_plan(plan_entries, plan)
   
     # Delete unattached volumes
     elif delete and volumes_to_delete:
-        resources_deleted = 0
-        snapshots_deleted = 0
-        for volume in volumes_to_delete:
-            try:
-                ec2.delete_volume(VolumeId=volume[3])
-                if delete_snap_bool and volume[9]:
-                    try:
-                        ec2.delete_snapshot(SnapshotId=volume[9])
-                    except Exception as e:
-                        click.echo(f"{account} - {region}: Error deleting snapshot {volume[9]}: {e}")
-                    else:
-                        # click.echo(f"Deleted snapshot {volume[9]}")
-                        snapshots_deleted += 1
-            except botocore.exceptions.ClientError as e:
-                if e.response['Error']['Code'] == 'InvalidSnapshot.NotFound':
-                    click.echo(f"Skipping deletion since {volume[9]} was already deleted")
-                    pass
-                else:
-                    click.echo(f"{account} - {region}: Error deleting volume {volume[3]}: {e}")
-            except Exception as e:
-                click.echo(f"{account} - {region}: Error deleting volume {volume[3]}: {e}")
-            else:
-                # click.echo(f"Deleted volume {volume[3]}")
-                output.append(volume)
-                resources_deleted += 1
-        if delete_snap_bool:
-            click.echo(f"\n{account} - {region}: Deleted {resources_deleted} volumes and {snapshots_deleted} snapshots")
-        else:
-            click.echo(f"\n{account} - {region}: Deleted {resources_deleted} volumes")
+        output = delete_ebs_volumes(ec2, account, region, volumes_to_delete, delete_snap_bool)
         write_output(output, headers, filename=file)
     # No unattached volumes found
     else:
         click.echo(f"{account} - {region}: No unattached volumes found exceeding the specified age")
+
+
+# ---------------- DELETE EBS VOLUMES ----------------------------
+def delete_ebs_volumes(ec2, account, region, volumes_to_delete, delete_snap_bool):
+    """Deletes the given EBS volumes (and associated snapshots) and returns the rows that were deleted"""
+    output = []
+    resources_deleted = 0
+    snapshots_deleted = 0
+    for volume in volumes_to_delete:
+        try:
+            ec2.delete_volume(VolumeId=volume[3])
+            if delete_snap_bool and volume[9]:
+                try:
+                    ec2.delete_snapshot(SnapshotId=volume[9])
+                except Exception as e:
+                    click.echo(f"{account} - {region}: Error deleting snapshot {volume[9]}: {e}")
+                else:
+                    # click.echo(f"Deleted snapshot {volume[9]}")
+                    snapshots_deleted += 1
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == 'InvalidSnapshot.NotFound':
+                click.echo(f"Skipping deletion since {volume[9]} was already deleted")
+                pass
+            else:
+                click.echo(f"{account} - {region}: Error deleting volume {volume[3]}: {e}")
+        except Exception as e:
+            click.echo(f"{account} - {region}: Error deleting volume {volume[3]}: {e}")
+        else:
+            # click.echo(f"Deleted volume {volume[3]}")
+            output.append(volume)
+            resources_deleted += 1
+    if delete_snap_bool:
+        click.echo(f"\n{account} - {region}: Deleted {resources_deleted} volumes and {snapshots_deleted} snapshots")
+    else:
+        click.echo(f"\n{account} - {region}: Deleted {resources_deleted} volumes")
+    return output
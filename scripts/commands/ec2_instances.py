@@ -1,5 +1,6 @@
 from libs.write_output import write_output
 from libs.get_client import get_aws_client
+from libs.plan import plan_entry, write_plan
 import click
 import boto3
 from datetime import datetime, timedelta, timezone
@@ -16,7 +17,8 @@ def cli():
 @click.option('--dry-run', is_flag=True, help='Show a list of all stopped EC2 instances that are to be deleted, but do not delete them')
 @click.option('-d', '--delete', is_flag=True, default=False, help='Delete EC2 instances stopped for more than the specified age')
 @click.option('-f', '--file', help='Custom file name to write output to')
-def ec2_instances(region, age, dry_run, delete, file):
+@click.option('--plan', help='Write a plan of the dry-run to this file so it can be executed later with apply')
+def ec2_instances(region, age, dry_run, delete, file, plan):
     """Terminate stopped EC2 instaces last stopped before a specified age"""
 
     if not any([dry_run, delete]):
@@ -35,6 +37,7 @@ def ec2_instances(region, age, dry_run, delete, file):
 
     # Filter stopped EC2 instances by age
     instances_to_delete = []
+    plan_entries = []
     cutoff_time = datetime.now(timezone.utc) - timedelta(days=age)
     for reservation in reservations:
         for instance in reservation['Instances']:
@@ -61,6 +64,7 @@ def ec2_instances(region, age, dry_run, delete, file):
                         name_tag = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), None)
                         instances_to_delete.append((account, account_id, region, instance['InstanceId'], name_tag, instance['InstanceType'], stopped_date))
                         headers=["Account", "Account ID", "Region", "EC2 Instance ID", "Instance name", "Instance type", "Stopped Date"]
+                        plan_entries.append(plan_entry('ec2-instance', instances_to_delete[-1], headers, instance))
 
     output = []
     # List stopped EC2 instances
@@ -70,20 +74,30 @@ def ec2_instances(region, age, dry_run, delete, file):
             output.append(instance[:len(instance)])
         write_output(output, headers, filename=file)
         # write_output(output, headers, filename=file, message=f"EC2 instances stopped for more than {age} days: {len(instances_to_delete)}")
+        if plan:
+            write_plan(plan_entries, plan)
     # Terminate stopped EC2 snapshots
     elif delete and instances_to_delete:
-        resources_deleted = 0
-        for instance in instances_to_delete:
-            try:
-                ec2.terminate_instances(InstanceIds=[instance[3]])
-            except Exception as e:
-                click.echo(f"{account} - {region}: Error deleting EC2 instance {instance[3]}: {e}")
-            else:
-                # click.echo(f"Terminated EC2 instance {instance[0]}")
-                output.append(instance)
-                resources_deleted += 1
-        click.echo(f"\n{account} - {region}: Deleted {resources_deleted} EC2 instances")
+        output = delete_ec2_instances(ec2, account, region, instances_to_delete)
         write_output(output, headers, filename=file)
     # No stopped EC2 instances
     else:
         click.echo(f"{account} - {region}: No stopped EC2 instances found exceeding the specified age")
+
+
+# ---------------- TERMINATE EC2 INSTANCES ----------------------------
+def delete_ec2_instances(ec2, account, region, instances_to_delete):
+    """Terminates the given EC2 instances and returns the rows that were terminated"""
+    output = []
+    resources_deleted = 0
+    for instance in instances_to_delete:
+        try:
+            ec2.terminate_instances(InstanceIds=[instance[3]])
+        except Exception as e:
+            click.echo(f"{account} - {region}: Error deleting EC2 instance {instance[3]}: {e}")
+        else:
+            # click.echo(f"Terminated EC2 instance {instance[0]}")
+            output.append(instance)
+            resources_deleted += 1
+    click.echo(f"\n{account} - {region}: Deleted {resources_deleted} EC2 instances")
+    return output
@@ -1,5 +1,8 @@
 from libs.write_output import write_output
 from libs.get_client import get_aws_client
+from libs.plan import plan_entry, write_plan
+from libs.reference_index import load_index
+from libs.sharded_list import list_images, list_snapshots, validate_shards
 import click
 import boto3
 from datetime import datetime, timedelta, timezone
@@ -15,7 +18,10 @@ def cli():
 @click.option('--dry-run', is_flag=True, help='Show a list of all snapshots that are to be deleted, but do not delete them')
 @click.option('-d', '--delete', is_flag=True, default=False, help='Delete all snapshots that are older than the specified age')
 @click.option('-f', '--file', help='Custom file name to write output to')
-def ec2_snapshots(region, age, dry_run, delete, file):
+@click.option('--plan', help='Write a plan of the dry-run to this file so it can be executed later with apply')
+@click.option('--reference-index', help='Reference index file built with the reference-index command. Snapshots referenced by AMIs in any account or region of the index are kept')
+@click.option('--shards', default='auto', callback=validate_shards, help='Number of shards to list snapshots and AMIs with in parallel (1-256), or "auto" to choose from the size of the inventory')
+def ec2_snapshots(region, age, dry_run, delete, file, plan, reference_index, shards):
     """Deletes orphaned EC2 snapshots older than a specified age"""
 
     if not any([dry_run, delete]):
@@ -32,8 +38,7 @@ def ec2_snapshots(region, age, dry_run, delete, file):
 
     # Get the list of AMIs and their associated snapshots
     # Useful to identify snapshots where volume has been deleted but snapshot is still linked to the AMI.
-    image_response = ec2.describe_images(Owners=['self'])
-    images = image_response['Images']
+    images = list_images(ec2, shards)
     ami_snapshots = {}
     for image in images:
         if image['State'] == 'available':
@@ -43,10 +48,18 @@ def ec2_snapshots(region, age, dry_run, delete, file):
                     ami_snapshots[ebs['Ebs']['SnapshotId']] = image['ImageId']
     # click.echo(ami_snapshots)
 
+    # Load snapshots referenced by AMIs in other accounts and regions of the organization
+    index = None
+    if reference_index:
+        index = load_index(reference_index)
+        if index is None:
+            return
+
     # Get the list of snapshots not linked to existing volumes or AMIs, and filter by age
     snapshots_to_delete = []
+    plan_entries = []
     cutoff_time = datetime.now(timezone.utc) - timedelta(days=age)
-    snapshots = ec2.describe_snapshots(OwnerIds=['self'])['Snapshots']
+    snapshots = list_snapshots(ec2, shards)
     for snapshot in snapshots:
         try:
             start_time = snapshot['StartTime']
@@ -57,6 +70,9 @@ def ec2_snapshots(region, age, dry_run, delete, file):
                     linked_ami = ami_snapshots[snapshot['SnapshotId']]
                     # click.echo(f"Skipping {snapshot['SnapshotId']} since it is linked to AMI {linked_ami}")
                     continue
+                # Check if Snapshot ID is referenced by an AMI in another account or region
+                if index is not None and snapshot['SnapshotId'] in index.snapshots:
+                    continue
                 # Check non-AMI snapshots and skip snapshot if snapshot volume is present in the list of existing volumes (linked to volume) 
                 # Example for non-AMI snapshots: EmeraldRanch - IP-0A6D16BD        
                 if ('Created by CreateImage' not in snapshot['Description'] and snapshot['VolumeId'] in volumes):
@@ -69,6 +85,7 @@ def ec2_snapshots(region, age, dry_run, delete, file):
                 snapshot_name = snapshot_name if snapshot_name else None
                 snapshots_to_delete.append((account, account_id, region, snapshot['SnapshotId'], snapshot_name, snapshot['VolumeSize'], snapshot['StorageTier'], start_date))
                 headers=["Account", "Account ID", "Region", "EC2 Snapshot ID", "Snapshot info", "Volume size (GiB)", "Storage tier", "Creation Date"]
+                plan_entries.append(plan_entry('ec2-snapshot', snapshots_to_delete[-1], headers, snapshot))
         except Exception as e:
             click.echo(f"Error filtering snapshots {snapshot['SnapshotId']}: {e}")
 
@@ -80,20 +97,30 @@ def ec2_snapshots(region, age, dry_run, delete, file):
         for snapshot in snapshots_to_delete:
             output.append(snapshot[:len(snapshot)])
         write_output(output, headers, filename=file)
+        if plan:
+            write_plan(plan_entries, plan)
     # Delete orphaned EC2 snapshots
     elif delete and snapshots_to_delete:
-        resources_deleted = 0
-        for snapshot in snapshots_to_delete:
-            try:
-                ec2.delete_snapshot(SnapshotId=snapshot[3])
-            except Exception as e:
-                click.echo(f"{account} - {region}: Error deleting snapshot {snapshot[3]}: {e}")
-            else:
-                # click.echo(f"Deleted snapshot {snapshot[3]}")
-                output.append(snapshot)
-                resources_deleted += 1
-        click.echo(f"\n{account} - {region}: Deleted {resources_deleted} EC2 snapshots") 
+        output = delete_ec2_snapshots(ec2, account, region, snapshots_to_delete)
         write_output(output, headers, filename=file)
     # No orphaned EC2 snapshots
     else:
         click.echo(f"{account} - {region}: No orphaned EC2 snapshots found exceeding the specified age")
+
+
+# ---------------- DELETE EC2 SNAPSHOTS ----------------------------
+def delete_ec2_snapshots(ec2, account, region, snapshots_to_delete):
+    """Deletes the given EC2 snapshots and returns the rows that were deleted"""
+    output = []
+    resources_deleted = 0
+    for snapshot in snapshots_to_delete:
+        try:
+            ec2.delete_snapshot(SnapshotId=snapshot[3])
+        except Exception as e:
+            click.echo(f"{account} - {region}: Error deleting snapshot {snapshot[3]}: {e}")
+        else:
+            # click.echo(f"Deleted snapshot {snapshot[3]}")
+            output.append(snapshot)
+            resources_deleted += 1
+    click.echo(f"\n{account} - {region}: Deleted {resources_deleted} EC2 snapshots") 
+    return output
@@ -0,0 +1,93 @@
+from libs.write_output import write_output
+from libs.get_client import get_aws_client
+from libs.plan import plan_entry, plan_metric, write_plan
+from libs.metrics import metric_query, fetch_metrics, summarize, RETENTION_DAYS
+from .ec2_instances import delete_ec2_instances
+import click
+from datetime import datetime, timedelta, timezone
+
+@click.group()
+def cli():
+    pass
+
+# ---------------- TERMINATE IDLE EC2 INSTANCES ----------------------------
+@cli.command()
+@click.option('-r', '--region', multiple=True, default=['us-east-1'], help='AWS region (can be passed multiple times)')
+@click.option('-a', '--age', type=int, default=30, help='The number of days to look back i.e: --age 7 will delete running instances that were idle for the last 7 days')
+@click.option('--cpu', type=float, default=5.0, help='Maximum CPU utilization (%) below which an instance is considered idle')
+@click.option('--dry-run', is_flag=True, help='Show a list of all idle EC2 instances that are to be deleted, but do not delete them')
+@click.option('-d', '--delete', is_flag=True, default=False, help='Delete EC2 instances that have been idle for more than the specified age')
+@click.option('-f', '--file', help='Custom file name to write output to')
+@click.option('--plan', help='Write a plan of the dry-run to this file so it can be executed later with apply')
+def idle_ec2_instances(region, age, cpu, dry_run, delete, file, plan):
+    """Terminate running EC2 instances whose CPU utilization stayed below a threshold for a specified age"""
+
+    if not any([dry_run, delete]):
+        click.echo('Please specify either --dry-run or --delete option.')
+        exit()
+
+    end_time = datetime.now(timezone.utc)
+    cutoff_time = end_time - timedelta(days=age)
+
+    # List running EC2 instances launched before the age window in every region
+    regions = {}
+    metric_requests = {}
+    for instance_region in region:
+        # Set up AWS client
+        ec2, account, account_id = get_aws_client('ec2', instance_region)
+        cloudwatch, account, account_id = get_aws_client('cloudwatch', instance_region)
+        try:
+            paginator = ec2.get_paginator('describe_instances')
+            pages = paginator.paginate(Filters=[{'Name': 'instance-state-name', 'Values': ['running']}])
+            # Instances managed by an Auto Scaling group would just be replaced, so they are skipped
+            instances = [instance for instance in pages.search("Reservations[].Instances[]") if instance['LaunchTime'] < cutoff_time
+                         and not any(tag['Key'] == 'aws:autoscaling:groupName' for tag in instance.get('Tags', []))]
+        except Exception as e:
+            click.echo(f"Error occurred while listing EC2 instances in {instance_region}: {e}")
+            continue
+        query_ids = [f"cpu{i}" for i in range(len(instances))]
+        queries = [metric_query(query_id, 'AWS/EC2', 'CPUUtilization', {'InstanceId': instance['InstanceId']}, 'Maximum') for query_id, instance in zip(query_ids, instances)]
+        regions[instance_region] = (ec2, account, account_id, instances, query_ids)
+        metric_requests[instance_region] = (cloudwatch, queries)
+
+    # Get the daily maximum CPU utilization of all instances, all regions at once
+    try:
+        values = fetch_metrics(metric_requests, cutoff_time, end_time)
+    except Exception as e:
+        click.echo(f"Error occurred while getting EC2 CPU metrics: {e}")
+        return
+
+    for instance_region, (ec2, account, account_id, instances, query_ids) in regions.items():
+        datapoints, max_cpu, _ = summarize(values[instance_region], query_ids)
+        # Idle when the CPU never exceeded the threshold during a fully observed age window
+        idle = (datapoints >= min(age, RETENTION_DAYS)) & (max_cpu < cpu)
+
+        # Filter idle EC2 instances
+        instances_to_delete = []
+        plan_entries = []
+        for i, instance in enumerate(instances):
+            if age > 0 and idle[i]:
+                launch_date = datetime.strftime(instance['LaunchTime'], '%Y-%m-%d')
+                # Get the value of the "Name" tag, if it exists
+                name_tag = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), None)
+                instances_to_delete.append((account, account_id, instance_region, instance['InstanceId'], name_tag, instance['InstanceType'], launch_date, round(float(max_cpu[i]), 2)))
+                headers = ["Account", "Account ID", "Region", "EC2 Instance ID", "Instance name", "Instance type", "Launch Date", "Max CPU (%)"]
+                metric = plan_metric('AWS/EC2', 'CPUUtilization', {'InstanceId': instance['InstanceId']}, 'Maximum', cpu)
+                plan_entries.append(plan_entry('ec2-instance', instances_to_delete[-1], headers, instance, metric))
+
+        output = []
+        # List idle EC2 instances
+        if dry_run and instances_to_delete:
+            click.echo(f"\n{account} - {instance_region}: EC2 instances idle for more than {age} days: {len(instances_to_delete)}")
+            for instance in instances_to_delete:
+                output.append(instance[:len(instance)])
+            write_output(output, headers, filename=file)
+            if plan:
+                write_plan(plan_entries, plan)
+        # Terminate idle EC2 instances
+        elif delete and instances_to_delete:
+            output = delete_ec2_instances(ec2, account, instance_region, instances_to_delete)
+            write_output(output, headers, filename=file)
+        # No idle EC2 instances
+        else:
+            click.echo(f"{account} - {instance_region}: No idle EC2 instances found exceeding the specified age")
@@ -0,0 +1,107 @@
+from libs.write_output import write_output
+from libs.get_client import get_aws_client
+from libs.plan import plan_entry, plan_metric, write_plan
+from libs.metrics import metric_query, fetch_metrics, summarize, RETENTION_DAYS
+import click
+from datetime import date, datetime, timedelta, timezone
+
+@click.group()
+def cli():
+    pass
+
+# ---------------- DELETE IDLE RDS INSTANCES ----------------------------
+@cli.command()
+@click.option('-r', '--region', multiple=True, default=['us-east-1'], help='AWS region (can be passed multiple times)')
+@click.option('-a', '--age', type=int, default=30, help='The number of days to look back i.e: --age 7 will delete RDS instances without connections in the last 7 days')
+@click.option('--dry-run', is_flag=True, help='Show a list of all idle RDS instances that are to be deleted, but do not delete them')
+@click.option('-d', '--delete', is_flag=True, default=False, help='Delete RDS instances (keeping a final snapshot) that have been idle for more than the specified age')
+@click.option('-f', '--file', help='Custom file name to write output to')
+@click.option('--plan', help='Write a plan of the dry-run to this file so it can be executed later with apply')
+def idle_rds_instances(region, age, dry_run, delete, file, plan):
+    """Delete RDS instances without any database connections for a specified age, keeping a final snapshot"""
+
+    if not any([dry_run, delete]):
+        click.echo('Please specify either --dry-run or --delete option.')
+        exit()
+
+    end_time = datetime.now(timezone.utc)
+    cutoff_time = end_time - timedelta(days=age)
+
+    # List available RDS instances created before the age window in every region
+    regions = {}
+    metric_requests = {}
+    for instance_region in region:
+        # Set up AWS client
+        rds, account, account_id = get_aws_client('rds', instance_region)
+        cloudwatch, account, account_id = get_aws_client('cloudwatch', instance_region)
+        try:
+            paginator = rds.get_paginator('describe_db_instances')
+            # Aurora instances are deleted together with their cluster, and read replicas cannot keep a final snapshot, so both are skipped
+            instances = [instance for instance in paginator.paginate().search("DBInstances[]")
+                         if instance['DBInstanceStatus'] == 'available' and 'DBClusterIdentifier' not in instance
+                         and 'ReadReplicaSourceDBInstanceIdentifier' not in instance and instance['InstanceCreateTime'] < cutoff_time]
+        except Exception as e:
+            click.echo(f"Error occurred while listing RDS instances in {instance_region}: {e}")
+            continue
+        query_ids = [f"conn{i}" for i in range(len(instances))]
+        queries = [metric_query(query_id, 'AWS/RDS', 'DatabaseConnections', {'DBInstanceIdentifier': instance['DBInstanceIdentifier']}, 'Maximum') for query_id, instance in zip(query_ids, instances)]
+        regions[instance_region] = (rds, account, account_id, instances, query_ids)
+        metric_requests[instance_region] = (cloudwatch, queries)
+
+    # Get the daily maximum number of connections of all instances, all regions at once
+    try:
+        values = fetch_metrics(metric_requests, cutoff_time, end_time)
+    except Exception as e:
+        click.echo(f"Error occurred while getting RDS connection metrics: {e}")
+        return
+
+    for instance_region, (rds, account, account_id, instances, query_ids) in regions.items():
+        datapoints, max_connections, _ = summarize(values[instance_region], query_ids)
+        # Idle when nothing connected during a fully observed age window
+        idle = (datapoints >= min(age, RETENTION_DAYS)) & (max_connections == 0)
+
+        # Filter idle RDS instances
+        instances_to_delete = []
+        plan_entries = []
+        for i, instance in enumerate(instances):
+            if age > 0 and idle[i]:
+                create_date = datetime.strftime(instance['InstanceCreateTime'], '%Y-%m-%d')
+                instances_to_delete.append((account, account_id, instance_region, instance['DBInstanceIdentifier'], instance['Engine'], instance['DBInstanceClass'], instance['AllocatedStorage'], create_date))
+                headers = ["Account", "Account ID", "Region", "RDS Instance name", "Engine", "Instance class", "Storage (GiB)", "Creation Date"]
+                metric = plan_metric('AWS/RDS', 'DatabaseConnections', {'DBInstanceIdentifier': instance['DBInstanceIdentifier']}, 'Maximum', 1)
+                plan_entries.append(plan_entry('rds-instance', instances_to_delete[-1], headers, instance, metric))
+
+        output = []
+        # List idle RDS instances
+        if dry_run and instances_to_delete:
+            click.echo(f"\n{account} - {instance_region}: RDS instances idle for more than {age} days: {len(instances_to_delete)}")
+            for instance in instances_to_delete:
+                output.append(instance[:len(instance)])
+            write_output(output, headers, filename=file)
+            if plan:
+                write_plan(plan_entries, plan)
+        # Delete idle RDS instances
+        elif delete and instances_to_delete:
+            output = delete_rds_instances(rds, account, instance_region, instances_to_delete)
+            write_output(output, headers, filename=file)
+        # No idle RDS instances
+        else:
+            click.echo(f"{account} - {instance_region}: No idle RDS instances found exceeding the specified age")
+
+
+# ---------------- DELETE RDS INSTANCES ----------------------------
+def delete_rds_instances(rds, account, region, instances_to_delete):
+    """Deletes the given RDS instances with a final snapshot and returns the rows that were deleted"""
+    output = []
+    resources_deleted = 0
+    for instance in instances_to_delete:
+        try:
+            rds.delete_db_instance(DBInstanceIdentifier=instance[3], SkipFinalSnapshot=False, FinalDBSnapshotIdentifier=f"{instance[3]}-final-{date.today()}")
+        except Exception as e:
+            click.echo(f"{account} - {region}: Error deleting RDS instance {instance[3]}: {e}")
+        else:
+            # click.echo(f"Deleted RDS instance {instance[3]}")
+            output.append(instance)
+            resources_deleted += 1
+    click.echo(f"\n{account} - {region}: Deleted {resources_deleted} RDS instances")
+    return output
@@ -1,5 +1,6 @@
 from libs.write_output import write_output
 from libs.get_client import get_aws_client
+from libs.plan import plan_entry, write_plan
 import click
 import boto3
 from datetime import datetime, timedelta, timezone
@@ -15,7 +16,8 @@ def cli():
 @click.option('--dry-run', is_flag=True, help='Show a list of all RDS snapshots that are to be deleted, but do not delete them')
 @click.option('-d', '--delete', is_flag=True, default=False, help='Delete all RDS snapshots that are older than the specified age')
 @click.option('-f', '--file', help='Custom file name to write output to')
-def rds_snapshots(region, age, dry_run, delete, file):
+@click.option('--plan', help='Write a plan of the dry-run to this file so it can be executed later with apply')
+def rds_snapshots(region, age, dry_run, delete, file, plan):
     """Deletes RDS snapshots that are older than a specified age"""
 
     if not any([dry_run, delete]):
@@ -37,6 +39,7 @@ def rds_snapshots(region, age, dry_run, delete, file):
     # Filter snapshots by age
     cutoff_time = datetime.now(timezone.utc) - timedelta(days=age)
     snapshots_to_delete = []
+    plan_entries = []
     for snapshot in snapshots:
         try:
             if snapshot['Status'] == 'available':
@@ -52,6 +55,7 @@ def rds_snapshots(region, age, dry_run, delete, file):
                     start_date = datetime.strftime(start_time, '%Y-%m-%d')
                     snapshots_to_delete.append((account, account_id, region, snapshot_id, snapshot_type, snapshot['AllocatedStorage'], start_date))
                     headers=["Account", "Account ID", "Region", "RDS Snapshot name", "Snapshot type", "Snapshot Size (GiB)",  "Creation Date"]
+                    plan_entries.append(plan_entry('rds-snapshot', snapshots_to_delete[-1], headers, snapshot))
         except Exception as e:
             click.echo(f"Error: {e}")
 
@@ -63,24 +67,33 @@ def rds_snapshots(region, age, dry_run, delete, file):
         for snapshot in snapshots_to_delete:
             output.append(snapshot[:len(snapshot)])
         write_output(output, headers, filename=file)
+        if plan:
+            write_plan(plan_entries, plan)
     # Delete RDS snapshots
     elif delete and snapshots_to_delete:
-        resources_deleted = 0
-        for snapshot in snapshots_to_delete:
-            try:
-                if snapshot[4] == "Instance":
-                    rds.delete_db_snapshot(DBSnapshotIdentifier=snapshot[3])
-                elif snapshot[4] == "Cluster":
-                    rds.delete_db_cluster_snapshot(DBClusterSnapshotIdentifier=snapshot[3])
-            except Exception as e:
-                click.echo(f"{account} - {region}: Error deleting RDS snapshot {snapshot[3]}: {e}")
-            else:
-                # click.echo(f"Deleted RDS snapshot {snapshot_id}")
-                output.append(snapshot)
-                resources_deleted += 1
-        click.echo(f"\n{account} - {region}: Deleted {resources_deleted} RDS snapshots")
+        output = delete_rds_snapshots(rds, account, region, snapshots_to_delete)
         write_output(output, headers, filename=file)
     # No RDS snapshots
     else:
         click.echo(f"{account} - {region}: No RDS snapshots found exceeding the specified age")
 
+
+# ---------------- DELETE RDS SNAPSHOTS ----------------------------
+def delete_rds_snapshots(rds, account, region, snapshots_to_delete):
+    """Deletes the given RDS instance and cluster snapshots and returns the rows that were deleted"""
+    output = []
+    resources_deleted = 0
+    for snapshot in snapshots_to_delete:
+        try:
+            if snapshot[4] == "Instance":
+                rds.delete_db_snapshot(DBSnapshotIdentifier=snapshot[3])
+            elif snapshot[4] == "Cluster":
+                rds.delete_db_cluster_snapshot(DBClusterSnapshotIdentifier=snapshot[3])
+        except Exception as e:
+            click.echo(f"{account} - {region}: Error deleting RDS snapshot {snapshot[3]}: {e}")
+        else:
+            # click.echo(f"Deleted RDS snapshot {snapshot_id}")
+            output.append(snapshot)
+            resources_deleted += 1
+    click.echo(f"\n{account} - {region}: Deleted {resources_deleted} RDS snapshots")
+    return output
@@ -0,0 +1,89 @@
+from libs.get_client import get_aws_client
+from libs.reference_index import write_index
+from libs.rate_limiter import fair_order
+from libs.sharded_list import list_images
+from .ami import get_asg_amis
+import click
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+@click.group()
+def cli():
+    pass
+
+# ---------------- BUILD ORG-WIDE REFERENCE INDEX ----------------------------
+@cli.command()
+@click.option('-r', '--region', multiple=True, default=['us-east-1'], help='AWS region (can be passed multiple times)')
+@click.option('-p', '--profiles', 'profiles_file', help='File with one AWS profile name per line (ex: accounts.txt). Defaults to the current credentials only')
+@click.option('-o', '--output', default='reference-index.idx', help='File to write the reference index to')
+@click.option('-w', '--workers', type=int, default=16, help='Number of accounts/regions to scan in parallel')
+def reference_index(region, profiles_file, output, workers):
+    """Build an index of AMIs and snapshots referenced in any account and region, for use with ami and ec2-snapshots"""
+
+    profiles = [None]
+    if profiles_file:
+        with open(profiles_file, 'r') as f:
+            profiles = [line.strip() for line in f if line.strip()]
+
+    # Interleave accounts so that every account gets scanned early in the sweep
+    scans = fair_order([(profile, scan_region) for profile in profiles for scan_region in region], key=lambda scan: scan[0])
+
+    ami_ids = set()
+    snapshot_ids = set()
+    failed_scans = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(collect_references, profile, scan_region): (profile, scan_region) for profile, scan_region in scans}
+        for future in as_completed(futures):
+            profile, scan_region = futures[future]
+            try:
+                scan_amis, scan_snapshots = future.result()
+            except Exception as e:
+                click.echo(f"{profile or 'default'} - {scan_region}: Error collecting references: {e}")
+                failed_scans.append((profile, scan_region))
+                continue
+            ami_ids.update(scan_amis)
+            snapshot_ids.update(scan_snapshots)
+
+    # A partial index would let ami and ec2-snapshots delete resources referenced by the accounts that failed
+    if failed_scans:
+        click.echo(f"\nReference index not written: {len(failed_scans)} of {len(scans)} account/region scans failed")
+        exit(1)
+
+    if not write_index(output, ami_ids, snapshot_ids):
+        exit(1)
+    click.echo(f"\nReferenced AMIs: {len(ami_ids)}, referenced snapshots: {len(snapshot_ids)} across {len(profiles)} account(s) and {len(region)} region(s). Index written to {output}")
+
+
+def collect_references(profile, region):
+    """Returns the AMI IDs in use and the snapshot IDs referenced by AMIs in one account and region"""
+    ec2_client = get_aws_client('ec2', region, profile=profile)
+    asg_client = get_aws_client('autoscaling', region, profile=profile)
+    if ec2_client is None or asg_client is None:
+        raise RuntimeError("could not create AWS clients")
+    ec2, account, account_id = ec2_client
+    asg, account, account_id = asg_client
+
+    ami_ids = set()
+    # AMIs used by instances
+    paginator = ec2.get_paginator('describe_instances')
+    ami_ids.update(paginator.paginate().search("Reservations[].Instances[?State.Name != 'terminated'].ImageId[]"))
+
+    # AMIs used by the default and latest version of launch templates
+    paginator = ec2.get_paginator('describe_launch_templates')
+    for template_id in paginator.paginate().search("LaunchTemplates[].LaunchTemplateId"):
+        versions = ec2.describe_launch_template_versions(LaunchTemplateId=template_id, Versions=['$Latest', '$Default'])['LaunchTemplateVersions']
+        ami_ids.update(version['LaunchTemplateData'].get('ImageId') for version in versions)
+
+    # AMIs used by ASG launch configurations and the launch template versions ASGs reference
+    ami_ids.update(get_asg_amis(ec2, asg))
+
+    # Snapshots referenced by AMIs owned by the account (including AMIs registered from snapshots shared by other accounts)
+    snapshot_ids = set()
+    for image in list_images(ec2):
+        for ebs in image['BlockDeviceMappings']:
+            if 'Ebs' in ebs and 'SnapshotId' in ebs['Ebs']:
+                snapshot_ids.add(ebs['Ebs']['SnapshotId'])
+
+    # Launch templates can point to SSM parameters instead of AMI IDs
+    ami_ids = {ami_id for ami_id in ami_ids if ami_id and ami_id.startswith('ami-')}
+    click.echo(f"{account} - {region}: Collected {len(ami_ids)} referenced AMIs and {len(snapshot_ids)} referenced snapshots")
+    return ami_ids, snapshot_ids
@@ -1,5 +1,7 @@
 from libs.write_output import write_output
 from libs.get_client import get_aws_client
+from libs.plan import plan_entry, plan_metric, write_plan
+from libs.metrics import metric_query, fetch_metrics, summarize, RETENTION_DAYS
 import click
 import boto3
 from datetime import datetime, timedelta, timezone
@@ -11,11 +13,12 @@ def cli():
 # ---------------- DELETE INACTIVE VPN CONNECTIONS ----------------------------
 @cli.command()
 @click.option('-r', '--region', default='us-east-1', help='AWS region')
-@click.option('-a', '--age', type=int, default=365, help='The age in days you want to keep i.e: --age 7 will delete VPN connections older than 7 days old')
+@click.option('-a', '--age', type=int, default=365, help='The age in days you want to keep i.e: --age 7 will delete VPN connections with no tunnel up in the last 7 days')
 @click.option('--dry-run', is_flag=True, help='Show a list of all inactive VPN connections that are to be deleted, but do not delete them')
 @click.option('-d', '--delete', is_flag=True, default=False, help='Delete VPN connections that have been inactive for more than the specified age')
 @click.option('-f', '--file', help='Custom file name to write output to')
-def vpn_connections(region, age, dry_run, delete, file):
+@click.option('--plan', help='Write a plan of the dry-run to this file so it can be executed later with apply')
+def vpn_connections(region, age, dry_run, delete, file, plan):
     """Delete inactive VPN connections that have been inactive for more than the specified age"""
 
     if not any([dry_run, delete]):
@@ -24,6 +27,7 @@ def vpn_connections(region, age, dry_run, delete, file):
 
     # Set up AWS client
     ec2, account, account_id = get_aws_client('ec2', region)
+    cloudwatch, account, account_id = get_aws_client('cloudwatch', region)
 
     # Get a list of existing VPN connections
     try:
@@ -32,16 +36,33 @@ def vpn_connections(region, age, dry_run, delete, file):
         click.echo(f"Error occurred while listing VPN connections: {e}")
         return
 
+    # Check if the VPN has telemetry data (won't exist if it just got deleted)
+    vpn_connections = [vpn for vpn in vpn_connections if 'VgwTelemetry' in vpn]
+
+    # Get the daily average TunnelState (1 when a tunnel is up, 0 when down) over the age window from CloudWatch
+    end_time = datetime.now(timezone.utc)
+    cutoff_time = end_time - timedelta(days=age)
+    query_ids = [f"vpn{i}" for i in range(len(vpn_connections))]
+    queries = [metric_query(query_id, 'AWS/VPN', 'TunnelState', {'VpnId': vpn['VpnConnectionId']}, 'Average') for query_id, vpn in zip(query_ids, vpn_connections)]
+    try:
+        values = fetch_metrics({region: (cloudwatch, queries)}, cutoff_time, end_time)[region]
+    except Exception as e:
+        # Without metrics every VPN falls back to the last status change of its tunnels
+        click.echo(f"Warning: could not get VPN tunnel metrics, using the last status change of the tunnels instead: {e}")
+        values = {}
+    datapoints, max_tunnel_state, uptime = summarize(values, query_ids)
+    # Inactive when no tunnel was up during a fully observed age window
+    never_up = (datapoints >= min(age, RETENTION_DAYS)) & (max_tunnel_state == 0)
+    # VPNs without metrics fall back to the last status change of the tunnels
+    no_metrics = datapoints == 0
+
     # Filter inactive VPN connections by age
     inactive_vpns = []
-    cutoff_time = datetime.now(timezone.utc) - timedelta(days=age)
-    for vpn in vpn_connections:
+    plan_entries = []
+    for i, vpn in enumerate(vpn_connections):
         # click.echo(vpn)
         # click.echo(f"{account}: {account_id} - {vpn['VpnConnectionId']}")
 
-        # Check if the VPN has telemetry data (won't exist if it just got deleted)
-        if 'VgwTelemetry' not in vpn:
-            continue
         # Get last status change for VPN tunnels
         last_status_change = max(item['LastStatusChange'] for item in vpn['VgwTelemetry'])
         # click.echo(f"Last status change: {last_status_change}")
@@ -49,13 +70,18 @@ def vpn_connections(region, age, dry_run, delete, file):
         latest_telemetry = next(telemetry for telemetry in vpn['VgwTelemetry'] if telemetry['LastStatusChange'] == last_status_change)
         status = latest_telemetry['Status']
         status_message = latest_telemetry['StatusMessage']
-        if age > 0 and last_status_change < cutoff_time and status != 'UP':
+        inactive = never_up[i] or (no_metrics[i] and last_status_change < cutoff_time)
+        if age > 0 and inactive and status != 'UP':
             vgw_id = vpn['VpnGatewayId']
             cgw_id = vpn['CustomerGatewayId']
             vpn_id = vpn['VpnConnectionId']
             vpn_name = next((tag['Value'] for tag in vpn.get('Tags', []) if tag['Key'] == 'Name'), None)
-            inactive_vpns.append((account, account_id, region, vpn_id, vpn_name, vgw_id, cgw_id, last_status_change, status, status_message))
-            headers = ["Account", "Account ID", "Region", "VPN Connection ID", "VPN Name", "VGW ID", "CGW ID", "Last Activity", "Status", "Status message"]
+            tunnel_uptime = None if no_metrics[i] else round(float(uptime[i]) * 100, 2)
+            inactive_vpns.append((account, account_id, region, vpn_id, vpn_name, vgw_id, cgw_id, last_status_change, status, status_message, tunnel_uptime))
+            headers = ["Account", "Account ID", "Region", "VPN Connection ID", "VPN Name", "VGW ID", "CGW ID", "Last Activity", "Status", "Status message", "Tunnel uptime (%)"]
+            # Any tunnel coming up (TunnelState 1) makes the VPN active again
+            metric = plan_metric('AWS/VPN', 'TunnelState', {'VpnId': vpn_id}, 'Maximum', 1)
+            plan_entries.append(plan_entry('vpn-connection', inactive_vpns[-1], headers, vpn, metric))
 
     output = []
     # List inactive VPN connections
@@ -64,20 +90,30 @@ def vpn_connections(region, age, dry_run, delete, file):
         for vpn in inactive_vpns:
             output.append(vpn[:len(vpn)])
         write_output(output, headers, filename=file)
+        if plan:
+            write_plan(plan_entries, plan)
     # Delete inactive VPN connections
     elif delete and inactive_vpns:
-        resources_deleted = 0
-        for vpn in inactive_vpns:
-            try:
-                ec2.delete_vpn_connection(VpnConnectionId=vpn[3])
-            except Exception as e:
-                click.echo(f"{account} - {region}: Error deleting VPN connection {vpn[3]}: {e}")
-            else:
-                # click.echo(f"{account} - {region}: Deleted VPN connection {vpn[3]}")
-                output.append(vpn)
-                resources_deleted += 1
-        click.echo(f"\n{account} - {region}: Deleted {resources_deleted} VPN connections")
+        output = delete_vpn_connections(ec2, account, region, inactive_vpns)
         write_output(output, headers, filename=file)
     # No inactive VPN connections
     else:
         click.echo(f"{account} - {region}: No inactive VPN connections found exceeding the specified age")
+
+
+# ---------------- DELETE VPN CONNECTIONS ----------------------------
+def delete_vpn_connections(ec2, account, region, inactive_vpns):
+    """Deletes the given VPN connections and returns the rows that were deleted"""
+    output = []
+    resources_deleted = 0
+    for vpn in inactive_vpns:
+        try:
+            ec2.delete_vpn_connection(VpnConnectionId=vpn[3])
+        except Exception as e:
+            click.echo(f"{account} - {region}: Error deleting VPN connection {vpn[3]}: {e}")
+        else:
+            # click.echo(f"{account} - {region}: Deleted VPN connection {vpn[3]}")
+            output.append(vpn)
+            resources_deleted += 1
+    click.echo(f"\n{account} - {region}: Deleted {resources_deleted} VPN connections")
+    return output
@@ -2,17 +2,24 @@
 
 import click
 import pkg_resources as pr
+from libs.rate_limiter import scheduler
 from .commands.ec2_instances import ec2_instances
 from .commands.ebs_volumes import ebs_volumes
 from .commands.ami import ami
 from .commands.vpn_connections import vpn_connections
 from .commands.ec2_snapshots import ec2_snapshots
 from .commands.rds_snapshots import rds_snapshots
+from .commands.idle_ec2_instances import idle_ec2_instances
+from .commands.idle_rds_instances import idle_rds_instances
+from .commands.apply import apply
+from .commands.reference_index import reference_index
 
 @click.group()
 @click.version_option(pr.get_distribution('aws-resource-cleanup').version, '--version', '-v')
-def cli():
-    pass
+@click.pass_context
+def cli(ctx):
+    # Report rate limits when the context closes, which also happens when a command calls exit()
+    ctx.call_on_close(scheduler.report)
 
 cli.add_command(ec2_instances)
 cli.add_command(ebs_volumes)
@@ -20,3 +27,8 @@ cli.add_command(ami)
 cli.add_command(ec2_snapshots)
 cli.add_command(rds_snapshots)
 cli.add_command(vpn_connections)
+cli.add_command(idle_ec2_instances)
+cli.add_command(idle_rds_instances)
+cli.add_command(apply)
+cli.add_command(reference_index)
+
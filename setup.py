@@ -8,6 +8,7 @@ setup(
     install_requires=[
         'click==8.1.3',
         'boto3==1.26.103',
+        'numpy==1.24.2',
     ],
     entry_points='''
         [console_scripts]
@@ -0,0 +1,93 @@
+from datetime import datetime, timezone
+
+import boto3
+from botocore.stub import ANY, Stubber
+
+from libs.plan import plan_entry, plan_metric
+from scripts.commands.apply import current_images, current_snapshots, recent_activity
+
+CREATED = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def make_client(service):
+    return boto3.client(service, region_name='us-east-1', aws_access_key_id='x', aws_secret_access_key='x')
+
+
+def image(image_id, snapshot_ids=()):
+    return {'ImageId': image_id, 'State': 'available', 'BlockDeviceMappings': [{'DeviceName': '/dev/xvda', 'Ebs': {'SnapshotId': s}} for s in snapshot_ids]}
+
+
+def asg_group(**kwargs):
+    group = {'AutoScalingGroupName': 'group', 'MinSize': 0, 'MaxSize': 1, 'DesiredCapacity': 1, 'DefaultCooldown': 300,
+             'AvailabilityZones': ['us-east-1a'], 'HealthCheckType': 'EC2', 'CreatedTime': CREATED}
+    group.update(kwargs)
+    return group
+
+
+def test_current_images_drops_missing_and_in_use_amis():
+    ids = ['ami-unused', 'ami-instance', 'ami-template', 'ami-launchconfig', 'ami-gone']
+    ec2, asg = make_client('ec2'), make_client('autoscaling')
+    with Stubber(ec2) as ec2_stub, Stubber(asg) as asg_stub:
+        ec2_stub.add_response('describe_images', {'Images': [image(i) for i in ids[:4]]}, {'Filters': [{'Name': 'image-id', 'Values': ids}]})
+        ec2_stub.add_response('describe_instances', {'Reservations': [{'Instances': [
+            {'InstanceId': 'i-1', 'ImageId': 'ami-instance', 'State': {'Name': 'running'}},
+            {'InstanceId': 'i-2', 'ImageId': 'ami-unused', 'State': {'Name': 'terminated'}},
+        ]}]}, {'Filters': [{'Name': 'image-id', 'Values': ids}]})
+        asg_stub.add_response('describe_launch_configurations', {'LaunchConfigurations': [
+            {'LaunchConfigurationName': 'lc', 'ImageId': 'ami-launchconfig', 'InstanceType': 't3.micro', 'CreatedTime': CREATED},
+        ]}, {})
+        asg_stub.add_response('describe_auto_scaling_groups', {'AutoScalingGroups': [asg_group(
+            LaunchTemplate={'LaunchTemplateId': 'lt-gone', 'Version': '2'},
+            Instances=[{'InstanceId': 'i-1', 'AvailabilityZone': 'us-east-1a', 'LifecycleState': 'InService', 'HealthStatus': 'Healthy',
+                        'ProtectedFromScaleIn': False, 'LaunchTemplate': {'LaunchTemplateId': 'lt-1', 'Version': '3'}}],
+        )]}, {})
+        # A deleted launch template is skipped instead of failing the whole re-check
+        ec2_stub.add_client_error('describe_launch_template_versions', 'InvalidLaunchTemplateId.NotFound')
+        ec2_stub.add_response('describe_launch_template_versions', {'LaunchTemplateVersions': [
+            {'LaunchTemplateId': 'lt-1', 'VersionNumber': 3, 'LaunchTemplateData': {'ImageId': 'ami-template'}},
+        ]})
+
+        current = current_images(ec2, ids, asg=asg)
+
+        ec2_stub.assert_no_pending_responses()
+        asg_stub.assert_no_pending_responses()
+    assert list(current) == ['ami-unused']
+
+
+def test_current_snapshots_drops_missing_and_ami_linked_snapshots():
+    ids = ['snap-unused', 'snap-linked', 'snap-gone']
+    ec2 = make_client('ec2')
+    with Stubber(ec2) as ec2_stub:
+        ec2_stub.add_response('describe_snapshots', {'Snapshots': [
+            {'SnapshotId': 'snap-unused', 'State': 'completed', 'VolumeId': 'vol-1'},
+            {'SnapshotId': 'snap-linked', 'State': 'completed', 'VolumeId': 'vol-2'},
+        ]}, {'OwnerIds': ['self'], 'Filters': [{'Name': 'snapshot-id', 'Values': ids}]})
+        ec2_stub.add_response('describe_images', {'Images': [image('ami-1', ['snap-linked'])]},
+                              {'Owners': ['self'], 'Filters': [{'Name': 'block-device-mapping.snapshot-id', 'Values': ids}]})
+
+        current = current_snapshots(ec2, ids)
+
+        ec2_stub.assert_no_pending_responses()
+    assert list(current) == ['snap-unused']
+    assert current['snap-unused']['VolumeId'] == 'vol-1'
+
+
+def test_recent_activity_returns_resources_that_reached_their_threshold():
+    def entry(instance_id, threshold):
+        row = ('acct', '123456789012', 'us-east-1', instance_id)
+        return plan_entry('ec2-instance', row, ['h'], {'State': {'Name': 'running'}}, plan_metric('AWS/EC2', 'CPUUtilization', {'InstanceId': instance_id}, 'Maximum', threshold))
+
+    entries = [entry('i-busy', 5.0), entry('i-idle', 5.0), entry('i-nodata', 5.0)]
+    cloudwatch = make_client('cloudwatch')
+    with Stubber(cloudwatch) as cloudwatch_stub:
+        # All entries are checked in a single GetMetricData call
+        cloudwatch_stub.add_response('get_metric_data', {'MetricDataResults': [
+            {'Id': 'm0', 'Values': [1.0, 42.0]},
+            {'Id': 'm1', 'Values': [1.0, 4.9]},
+            {'Id': 'm2', 'Values': []},
+        ]}, {'MetricDataQueries': ANY, 'StartTime': ANY, 'EndTime': ANY})
+
+        active = recent_activity(cloudwatch, entries)
+
+        cloudwatch_stub.assert_no_pending_responses()
+    assert active == {'i-busy'}
@@ -0,0 +1,57 @@
+from datetime import datetime, timezone
+
+from libs.plan import fingerprint, plan_entry, read_plan, write_plan
+
+
+def make_image(state='available'):
+    return {
+        'ImageId': 'ami-0123456789abcdef0',
+        'State': state,
+        'CreationDate': '2020-01-01T00:00:00.000Z',
+        'BlockDeviceMappings': [
+            {'DeviceName': '/dev/xvda', 'Ebs': {'SnapshotId': 'snap-0123456789abcdef0', 'VolumeSize': 8, 'VolumeType': 'gp3'}},
+            {'DeviceName': '/dev/xvdb', 'VirtualName': 'ephemeral0'},
+        ],
+    }
+
+
+def make_rds_snapshot(status='available'):
+    return {
+        'DBSnapshotIdentifier': 'db-snapshot',
+        'Status': status,
+        'SnapshotCreateTime': datetime(2020, 1, 1, 12, 30, tzinfo=timezone.utc),
+    }
+
+
+def test_fingerprint_matches_after_plan_round_trip(tmp_path):
+    plan = tmp_path / 'plan.jsonl'
+    ami_row = ('acct', '123456789012', 'us-east-1', 'ami-0123456789abcdef0', 'name', '2020-01-01', [('snap-0123456789abcdef0', 8, 'gp3')])
+    rds_row = ('acct', '123456789012', 'us-east-1', 'db-snapshot', 'Instance', 20, '2020-01-01')
+    write_plan([plan_entry('ami', ami_row, ['h'], make_image()), plan_entry('rds-snapshot', rds_row, ['h'], make_rds_snapshot())], str(plan))
+
+    ami_entry, rds_entry = read_plan(str(plan))
+    # A fresh describe of the unchanged resources produces the same fingerprints, datetimes included
+    assert ami_entry['fingerprint'] == fingerprint('ami', make_image())
+    assert rds_entry['fingerprint'] == fingerprint('rds-snapshot', make_rds_snapshot())
+    # Rows keep the values the delete functions index into, tuples come back as lists
+    assert tuple(ami_entry['row'])[3] == 'ami-0123456789abcdef0'
+    assert tuple(ami_entry['row'])[6][0][0] == 'snap-0123456789abcdef0'
+    assert tuple(rds_entry['row'])[4] == 'Instance'
+
+
+def test_fingerprint_changes_with_relevant_state():
+    assert fingerprint('ami', make_image()) != fingerprint('ami', make_image(state='pending'))
+    assert fingerprint('rds-snapshot', make_rds_snapshot()) != fingerprint('rds-snapshot', make_rds_snapshot(status='creating'))
+
+
+def test_vpn_fingerprint_ignores_last_status_change():
+    def vpn(last_status_change):
+        return {'State': 'available', 'VgwTelemetry': [{'OutsideIpAddress': '1.2.3.4', 'Status': 'DOWN', 'LastStatusChange': last_status_change}]}
+
+    assert fingerprint('vpn-connection', vpn(datetime(2020, 1, 1))) == fingerprint('vpn-connection', vpn(datetime(2023, 1, 1)))
+
+
+def test_read_plan_skips_invalid_lines(tmp_path):
+    plan = tmp_path / 'plan.jsonl'
+    plan.write_text('{"id": "a"}\nnot json\n\n{"id": "b"}\n')
+    assert [entry['id'] for entry in read_plan(str(plan))] == ['a', 'b']
@@ -0,0 +1,99 @@
+import random
+
+from libs.sharded_list import list_snapshots, shard_prefixes, MAX_SHARDS
+
+
+def long_id(rng):
+    return 'snap-0%016x' % rng.getrandbits(64)
+
+
+def legacy_id(rng):
+    return 'snap-%08x' % rng.getrandbits(32)
+
+
+def shard_of(resource_id, shards):
+    return [i for i, prefixes in enumerate(shards) if resource_id[len('snap-'):].startswith(tuple(prefixes))]
+
+
+class FakeEC2:
+    """Pages through a fixed list of snapshots, honoring snapshot-id prefix filters"""
+
+    def __init__(self, snapshot_ids):
+        self.snapshots = [{'SnapshotId': snapshot_id} for snapshot_id in snapshot_ids]
+        self.calls = 0
+
+    def can_paginate(self, operation):
+        return True
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, PaginationConfig, **kwargs):
+        token = PaginationConfig.get('StartingToken')
+        while True:
+            page = self.describe_snapshots(MaxResults=PaginationConfig['PageSize'], NextToken=token, **kwargs)
+            yield page
+            token = page.get('NextToken')
+            if not token:
+                break
+
+    def describe_snapshots(self, MaxResults, NextToken=None, Filters=(), OwnerIds=None):
+        self.calls += 1
+        snapshots = self.snapshots
+        for snapshot_filter in Filters:
+            prefixes = tuple(value.rstrip('*') for value in snapshot_filter['Values'])
+            snapshots = [s for s in snapshots if s['SnapshotId'].startswith(prefixes)]
+        start = int(NextToken or 0)
+        page = {'Snapshots': snapshots[start:start + MaxResults]}
+        if start + MaxResults < len(snapshots):
+            page['NextToken'] = str(start + MaxResults)
+        return page
+
+
+def test_every_id_falls_in_exactly_one_shard():
+    rng = random.Random(1)
+    ids = [long_id(rng) for _ in range(2000)] + [legacy_id(rng) for _ in range(2000)]
+    for count in (2, 3, 16, 32, MAX_SHARDS):
+        shards = shard_prefixes(count)
+        for resource_id in ids:
+            assert len(shard_of(resource_id, shards)) == 1
+
+
+def test_shards_are_balanced_for_long_ids():
+    rng = random.Random(2)
+    ids = [long_id(rng) for _ in range(100000)]
+    for count in (2, 4, 8, 16, 32, 64, MAX_SHARDS):
+        shards = shard_prefixes(count)
+        sizes = [0] * count
+        for resource_id in ids:
+            sizes[shard_of(resource_id, shards)[0]] += 1
+        mean = len(ids) / count
+        assert min(sizes) > 0.6 * mean
+        assert max(sizes) < 1.4 * mean
+
+
+def test_small_inventory_is_listed_in_one_call():
+    rng = random.Random(3)
+    ec2 = FakeEC2([long_id(rng) for _ in range(500)])
+    assert len(list_snapshots(ec2)) == 500
+    assert ec2.calls == 1
+
+
+def test_auto_shards_scale_with_inventory_size():
+    rng = random.Random(4)
+    ids = [long_id(rng) for _ in range(20000)] + [legacy_id(rng) for _ in range(2000)]
+    ec2 = FakeEC2(ids)
+    snapshots = list_snapshots(ec2)
+    assert sorted(s['SnapshotId'] for s in snapshots) == sorted(set(ids))
+    # About 22k snapshots need a handful of shards of a few pages each, not 256 mostly empty shards
+    assert ec2.calls < 40
+
+
+def test_auto_continues_single_listing_after_first_page():
+    rng = random.Random(5)
+    ids = [long_id(rng) for _ in range(2500)]
+    ec2 = FakeEC2(ids)
+    snapshots = list_snapshots(ec2)
+    assert sorted(s['SnapshotId'] for s in snapshots) == sorted(ids)
+    # First page, one probe and the two remaining pages
+    assert ec2.calls == 4